@@ -4,27 +4,42 @@ import logging
 import os
 import re
 import sys
+import requests
 import testlib
 from rescale.client import RescaleConnect, RescaleFile, RescaleJob
+from rescale.index import RescaleIndex
 
 BASE_JOB_RE = re.compile('^build[0-9\.]+-testcase[0-9\.]+$')
 DRY_RUN = True
 
 
-def get_base_test_job_ids():
-    job_results = RescaleConnect()._paginate('jobs/')
-    return {job['name']: job['id'] for job in job_results
-            if BASE_JOB_RE.match(job['name'])}
-
-
-def get_job(job_id):
-    job_result = RescaleConnect()._request('GET', 'jobs/{0}'.format(job_id))
+def get_base_test_job_ids(index):
+    index.refresh_jobs()
+    job_ids = {}
+    # jobs come newest first, so a re-created base job wins over older ones
+    for job, _ in index.find_jobs(regex=BASE_JOB_RE.pattern):
+        job_ids.setdefault(job['name'], job['id'])
+    return job_ids
+
+
+def get_job(job_id, index):
+    try:
+        job_result = RescaleConnect()._request('GET', 'jobs/{0}'.format(job_id))
+    except requests.HTTPError as e:
+        if e.response is None or e.response.status_code != 404:
+            raise
+        logging.info('Job {0} was deleted, dropping it from the index'
+                     .format(job_id))
+        index.remove_job(job_id)
+        return None
     return job_result.json()
 
 
-def create_delta_job(base_name, delta_name, job_id, delta_id):
+def create_delta_job(base_name, delta_name, job_id, delta_id, index):
     new_name = '{0}-{1}'.format(base_name, delta_name)
-    job = get_job(job_id)
+    job = get_job(job_id, index)
+    if job is None:
+        return None
 
     for job_analysis in job['jobanalyses']:
         job_analysis['inputFiles'].append({'id': delta_id})
@@ -46,12 +61,14 @@ if __name__ == '__main__':
         sys.exit(1)
 
     delta_info = RescaleFile(file_path=build_delta_archive)
+    index = RescaleIndex()
 
-    for base_name, job_id in get_base_test_job_ids().items():
+    for base_name, job_id in get_base_test_job_ids(index).items():
         print(base_name)
         new_job = create_delta_job(base_name,
                                    testlib.strip_suffix(delta_info.name),
                                    job_id,
-                                   delta_info.id)
-        if not DRY_RUN:
+                                   delta_info.id,
+                                   index)
+        if new_job is not None and not DRY_RUN:
             new_job.submit()
@@ -1,5 +1,4 @@
 import argparse
-import ConfigParser
 import json
 import logging
 import time
@@ -17,6 +16,12 @@ except ImportError:
     urlparse.urlencode = urllib.urlencode
     urllib.parse = urlparse
 
+try:
+    import ConfigParser
+except ImportError:
+    # python 3 renamed the module
+    import configparser as ConfigParser
+
 API_CONFIG_FILE = '~/.config/rescale/apiconfig'
 DEFAULT_API_URL = 'https://platform.rescale.com/api/v3/'
 
@@ -147,7 +152,14 @@ class RescaleFile(RescaleConnect):
             yield RescaleFile(json_data=json_data)
 
     @staticmethod
-    def get_newest_by_name(name):
+    def get_newest_by_name(name, index=None):
+        # the index matches exact names only, while the API search also
+        # matches substrings, so the search is still used when no file has
+        # exactly this name
+        if index is not None:
+            newest = index.get_newest_file_by_name(name)
+            if newest is not None:
+                return newest
         return next(RescaleFile.search(name), None)
 
 
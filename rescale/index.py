@@ -0,0 +1,300 @@
+import calendar
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+
+import requests
+
+from rescale.client import RescaleConnect, RescaleFile
+
+INDEX_FILE = '~/.config/rescale/index.db'
+
+# Statuses after which a job's status will not change again, so there is no
+# need to ask the API for it on later refreshes. Jobs that are stopped or
+# fail also finish as Completed, with the cause in statusReason, which is
+# why RescaleJob.wait only waits for Completed as well.
+TERMINAL_STATUSES = ('Completed',)
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    status TEXT,
+    status_changed REAL,
+    seq INTEGER,
+    raw TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_name ON jobs (name, seq);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status);
+CREATE TABLE IF NOT EXISTS files (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    seq INTEGER,
+    raw TEXT
+);
+CREATE INDEX IF NOT EXISTS files_name ON files (name, seq);
+CREATE TABLE IF NOT EXISTS syncs (
+    resource TEXT PRIMARY KEY,
+    last_synced REAL
+);
+CREATE TABLE IF NOT EXISTS account (
+    identity TEXT
+);
+'''
+
+
+def _regexp(pattern, value):
+    return value is not None and re.search(pattern, value) is not None
+
+
+def _timestamp(date):
+    """Converts an API date such as 2016-08-17T21:49:51.478Z to seconds."""
+    date = date.rstrip('Z').split('.')[0]
+    return calendar.timegm(time.strptime(date, '%Y-%m-%dT%H:%M:%S'))
+
+
+def _is_not_found(error):
+    return error.response is not None and error.response.status_code == 404
+
+
+class RescaleIndex(object):
+    """Local SQLite index of the jobs and files in a Rescale account.
+
+    The API lists jobs and files newest first, so a refresh only pages until
+    it reaches a record that is already indexed. Records deleted or renamed
+    on the platform are only picked up by a full refresh.
+
+    The index remembers the API URL and key it was built with and starts
+    over empty when first used with a different account. Queries made
+    before anything talks to the API answer from the index as it was.
+    """
+
+    def __init__(self, path=INDEX_FILE, connect=None):
+        if path != ':memory:':
+            path = os.path.expanduser(path)
+            directory = os.path.dirname(path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+        self._connect = connect
+        self._account_checked = False
+        self._db = sqlite3.connect(path)
+        self._db.create_function('REGEXP', 2, _regexp)
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    @property
+    def connect(self):
+        if self._connect is None:
+            self._connect = RescaleConnect()
+        if not self._account_checked:
+            self._check_account()
+        return self._connect
+
+    def _check_account(self):
+        identity = hashlib.sha256('{0}\n{1}'.format(
+            self._connect._root_url, self._connect.api_key).encode('utf-8')) \
+            .hexdigest()
+        self._account_checked = True
+        row = self._db.execute('SELECT identity FROM account').fetchone()
+        if row is not None and row[0] == identity:
+            return
+        with self._db:
+            for table in ('jobs', 'files', 'syncs', 'account'):
+                self._db.execute('DELETE FROM {0}'.format(table))
+            self._db.execute('INSERT INTO account (identity) VALUES (?)',
+                             (identity,))
+
+    def last_synced(self, resource):
+        row = self._db.execute('SELECT last_synced FROM syncs WHERE resource = ?',
+                               (resource,)).fetchone()
+        return row[0] if row else None
+
+    def _mark_synced(self, resource):
+        self._db.execute('INSERT OR REPLACE INTO syncs (resource, last_synced) '
+                         'VALUES (?, ?)', (resource, time.time()))
+
+    def _fetch_new(self, table, url, full):
+        """Returns records from url newer than the newest one already indexed.
+
+        Records are returned newest first, as listed by the API.
+        """
+        known = set(row[0] for row in
+                    self._db.execute('SELECT id FROM {0}'.format(table)))
+        records = []
+        for json_data in self.connect._paginate(url):
+            if not full and json_data['id'] in known:
+                break
+            records.append(json_data)
+        return records
+
+    def _prune(self, table, records):
+        stale = set(row[0] for row in
+                    self._db.execute('SELECT id FROM {0}'.format(table)))
+        stale.difference_update(r['id'] for r in records)
+        self._db.executemany('DELETE FROM {0} WHERE id = ?'.format(table),
+                             [(record_id,) for record_id in stale])
+
+    def _next_seq(self, table):
+        return self._db.execute('SELECT COALESCE(MAX(seq), 0) FROM {0}'
+                                .format(table)).fetchone()[0] + 1
+
+    def refresh_jobs(self, full=False):
+        records = self._fetch_new('jobs', 'jobs/', full)
+        with self._db:
+            if full:
+                self._prune('jobs', records)
+            # insert oldest first so that a higher seq always means newer
+            for seq, json_data in enumerate(reversed(records),
+                                            self._next_seq('jobs')):
+                self._db.execute(
+                    'INSERT OR REPLACE INTO jobs '
+                    '(id, name, status, status_changed, seq, raw) VALUES (?, ?, '
+                    '(SELECT status FROM jobs WHERE id = ?), '
+                    '(SELECT status_changed FROM jobs WHERE id = ?), ?, ?)',
+                    (json_data['id'], json_data['name'], json_data['id'],
+                     json_data['id'], seq, json.dumps(json_data)))
+            self._mark_synced('jobs')
+        return len(records)
+
+    def refresh_statuses(self, job_ids=None, inactive_after=None):
+        """Fetches the latest status of jobs not yet in a terminal state.
+
+        This sends one request per job, so limit it where possible. job_ids
+        limits the refresh to the given jobs. Jobs whose latest status is
+        dated more than inactive_after seconds ago, such as jobs that were
+        never submitted, are skipped.
+        """
+        query = ('SELECT id FROM jobs WHERE (status IS NULL OR status NOT IN '
+                 '({0}))'.format(','.join('?' * len(TERMINAL_STATUSES))))
+        params = list(TERMINAL_STATUSES)
+        if inactive_after is not None:
+            query += ' AND (status IS NULL OR status_changed >= ?)'
+            params.append(time.time() - inactive_after)
+        query += ' ORDER BY seq DESC'
+        pending = [row[0] for row in self._db.execute(query, params)]
+        if job_ids is not None:
+            job_ids = set(job_ids)
+            pending = [job_id for job_id in pending if job_id in job_ids]
+        # each status is committed as soon as it arrives, so a failed request
+        # keeps the work already done and holds no write lock while fetching
+        for job_id in pending:
+            try:
+                latest = next(self.connect._paginate(
+                    'jobs/{job_id}/statuses/'.format(job_id=job_id)), None)
+            except requests.HTTPError as e:
+                if not _is_not_found(e):
+                    raise
+                # deleted since the last full refresh
+                self.remove_job(job_id)
+                continue
+            if latest is not None:
+                changed = latest.get('statusDate')
+                changed = _timestamp(changed) if changed else time.time()
+                with self._db:
+                    self._db.execute(
+                        'UPDATE jobs SET status = ?, status_changed = ? '
+                        'WHERE id = ?', (latest['status'], changed, job_id))
+        with self._db:
+            self._mark_synced('statuses')
+        return len(pending)
+
+    def refresh_files(self, full=False):
+        records = self._fetch_new('files', 'files/', full)
+        with self._db:
+            if full:
+                self._prune('files', records)
+            for seq, json_data in enumerate(reversed(records),
+                                            self._next_seq('files')):
+                self._db.execute(
+                    'INSERT OR REPLACE INTO files (id, name, seq, raw) '
+                    'VALUES (?, ?, ?, ?)',
+                    (json_data['id'], json_data['name'], seq,
+                     json.dumps(json_data)))
+            self._mark_synced('files')
+        return len(records)
+
+    def refresh(self, full=False, statuses=False, inactive_after=None):
+        self.refresh_jobs(full)
+        self.refresh_files(full)
+        if statuses:
+            self.refresh_statuses(inactive_after=inactive_after)
+
+    def find_jobs(self, name=None, regex=None, status=None):
+        """Yields (json_data, status) pairs for the matching indexed jobs.
+
+        Jobs are yielded newest first.
+
+        json_data is the job as listed by the API, and status is the latest
+        status fetched by refresh_statuses, or None if it was never fetched.
+        """
+        clauses, params = [], []
+        if name is not None:
+            clauses.append('name = ?')
+            params.append(name)
+        if regex is not None:
+            clauses.append('name REGEXP ?')
+            params.append(regex)
+        if status is not None:
+            clauses.append('status = ?')
+            params.append(status)
+        query = 'SELECT raw, status FROM jobs'
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        query += ' ORDER BY seq DESC'
+        for raw, job_status in self._db.execute(query, params):
+            yield json.loads(raw), job_status
+
+    def remove_job(self, job_id):
+        with self._db:
+            self._db.execute('DELETE FROM jobs WHERE id = ?', (job_id,))
+
+    def get_job_status(self, job_id):
+        row = self._db.execute('SELECT status FROM jobs WHERE id = ?',
+                               (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def find_files(self, name=None, regex=None):
+        """Yields the matching indexed files, newest first, as API json."""
+        clauses, params = [], []
+        if name is not None:
+            clauses.append('name = ?')
+            params.append(name)
+        if regex is not None:
+            clauses.append('name REGEXP ?')
+            params.append(regex)
+        query = 'SELECT raw FROM files'
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        query += ' ORDER BY seq DESC'
+        for (raw,) in self._db.execute(query, params):
+            yield json.loads(raw)
+
+    def remove_file(self, file_id):
+        with self._db:
+            self._db.execute('DELETE FROM files WHERE id = ?', (file_id,))
+
+    def get_newest_file_by_name(self, name):
+        """Returns the newest file named exactly name, or None.
+
+        The files are refreshed first, which costs a single page of listing
+        once the index is up to date. Each match is then checked with one
+        request, and files deleted since they were indexed are dropped from
+        the index and skipped.
+        """
+        self.refresh_files()
+        for json_data in list(self.find_files(name=name)):
+            try:
+                self.connect._request('GET', 'files/{id}'.format(
+                    id=json_data['id']))
+            except requests.HTTPError as e:
+                if not _is_not_found(e):
+                    raise
+                self.remove_file(json_data['id'])
+                continue
+            return RescaleFile(self.connect.api_key, json_data=json_data)
+        return None
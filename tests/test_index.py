@@ -0,0 +1,239 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import requests
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from rescale.client import RescaleFile
+from rescale.index import RescaleIndex
+
+
+def http_error(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    return requests.HTTPError(response=response)
+
+
+class FakeConnect(object):
+    """Serves jobs, files and statuses from memory, newest first."""
+
+    def __init__(self, api_key='key', root_url='https://example.com/api/v3/'):
+        self.api_key = api_key
+        self._root_url = root_url
+        self.jobs = []
+        self.files = []
+        self.statuses = {}
+        self.deleted_files = set()
+        self.deleted_jobs = set()
+        self.failing_jobs = set()
+        self.fetched = []
+
+    def _paginate(self, url):
+        if url == 'jobs/':
+            records = self.jobs
+        elif url == 'files/':
+            records = self.files
+        else:
+            job_id = url.split('/')[1]
+            if job_id in self.deleted_jobs:
+                raise http_error(404)
+            if job_id in self.failing_jobs:
+                raise http_error(502)
+            records = self.statuses.get(job_id, [])
+        for record in records:
+            self.fetched.append((url, record.get('id')))
+            yield record
+
+    def _request(self, method, relative_url, **kwargs):
+        if relative_url.split('/')[1] in self.deleted_files:
+            raise http_error(404)
+
+
+class RescaleIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        # RescaleFile reads the api config on construction
+        patcher = mock.patch('rescale.client.RescaleConfig')
+        self.config = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.connect = FakeConnect()
+        self.index = RescaleIndex(':memory:', connect=self.connect)
+        self.addCleanup(self.index.close)
+
+    def add_jobs(self, *names):
+        for name in names:
+            job_id = 'j{0}'.format(len(self.connect.jobs) + 1)
+            self.connect.jobs.insert(0, {'id': job_id, 'name': name})
+
+    def add_files(self, *names):
+        for name in names:
+            file_id = 'f{0}'.format(len(self.connect.files) + 1)
+            self.connect.files.insert(0, {'id': file_id, 'name': name})
+
+    def job_ids(self, **kwargs):
+        return [job['id'] for job, _ in self.index.find_jobs(**kwargs)]
+
+    def test_incremental_refresh_stops_at_first_known_job(self):
+        self.add_jobs('a', 'b', 'c')
+        self.assertEqual(self.index.refresh_jobs(), 3)
+        self.add_jobs('d', 'e')
+        del self.connect.fetched[:]
+
+        self.assertEqual(self.index.refresh_jobs(), 2)
+        self.assertEqual(self.connect.fetched,
+                         [('jobs/', 'j5'), ('jobs/', 'j4'), ('jobs/', 'j3')])
+        self.assertEqual(self.job_ids(), ['j5', 'j4', 'j3', 'j2', 'j1'])
+
+    def test_full_refresh_prunes_deleted_jobs_and_keeps_statuses(self):
+        self.add_jobs('a', 'b', 'c')
+        self.connect.statuses = {'j1': [{'status': 'Completed'}]}
+        self.index.refresh(statuses=True)
+        del self.connect.jobs[1]
+
+        self.index.refresh_jobs(full=True)
+        self.assertEqual(self.job_ids(), ['j3', 'j1'])
+        self.assertEqual(self.index.get_job_status('j1'), 'Completed')
+
+    def test_find_jobs_by_name_regex_and_status(self):
+        self.add_jobs('build1-testcase1', 'other', 'build2-testcase1')
+        self.connect.statuses = {'j3': [{'status': 'Executing'}]}
+        self.index.refresh(statuses=True)
+
+        self.assertEqual(self.job_ids(name='other'), ['j2'])
+        self.assertEqual(self.job_ids(regex=r'^build[0-9]+-testcase[0-9]+$'),
+                         ['j3', 'j1'])
+        self.assertEqual(self.job_ids(status='Executing'), ['j3'])
+
+    def test_find_jobs_returns_status_apart_from_api_data(self):
+        self.connect.jobs = [{'id': 'j1', 'name': 'a', 'status': 'api'}]
+        self.index.refresh_jobs()
+
+        job, status = next(self.index.find_jobs())
+        self.assertEqual(job, {'id': 'j1', 'name': 'a', 'status': 'api'})
+        self.assertIsNone(status)
+
+    def test_status_failure_keeps_statuses_already_fetched(self):
+        self.add_jobs('a', 'b', 'c')
+        self.index.refresh_jobs()
+        self.connect.statuses = {'j3': [{'status': 'Executing'}],
+                                 'j2': [{'status': 'Executing'}]}
+        self.connect.failing_jobs = {'j1'}
+
+        # newest jobs are checked first, so j1 fails after j3 and j2
+        self.assertRaises(requests.HTTPError, self.index.refresh_statuses)
+        self.assertEqual(self.index.get_job_status('j3'), 'Executing')
+        self.assertEqual(self.index.get_job_status('j2'), 'Executing')
+        self.assertIsNone(self.index.get_job_status('j1'))
+
+    def test_status_refresh_drops_deleted_jobs(self):
+        self.add_jobs('a', 'b', 'c')
+        self.index.refresh_jobs()
+        self.connect.statuses = {'j1': [{'status': 'Executing'}]}
+        self.connect.deleted_jobs = {'j2'}
+
+        self.assertEqual(self.index.refresh_statuses(), 3)
+        self.assertEqual(self.index.get_job_status('j1'), 'Executing')
+        self.assertEqual(self.job_ids(), ['j3', 'j1'])
+        self.assertIsNotNone(self.index.last_synced('statuses'))
+
+    def test_status_refresh_skips_completed_and_inactive_jobs(self):
+        self.add_jobs('a', 'b', 'c', 'd')
+        self.connect.statuses = {
+            'j1': [{'status': 'Completed'}],
+            'j2': [{'status': 'Pending',
+                    'statusDate': '2016-08-17T21:49:51.478000Z'}],
+            'j3': [{'status': 'Executing'}]}
+        self.index.refresh(statuses=True)
+
+        self.assertEqual(self.index.refresh_statuses(), 3)
+        self.assertEqual(self.index.refresh_statuses(job_ids=['j1', 'j4']), 1)
+        self.assertEqual(self.index.refresh_statuses(inactive_after=60), 2)
+        with mock.patch('time.time', return_value=time.time() + 3600):
+            self.assertEqual(self.index.refresh_statuses(inactive_after=60), 1)
+
+    def test_refresh_leaves_statuses_alone_by_default(self):
+        self.add_jobs('a')
+        self.index.refresh()
+
+        self.assertEqual(self.connect.fetched, [('jobs/', 'j1')])
+        self.assertIsNone(self.index.last_synced('statuses'))
+
+    def test_file_order_survives_incremental_and_full_refresh(self):
+        self.add_files('a.zip', 'b.zip', 'a.zip')
+        self.index.refresh_files()
+        self.add_files('a.zip')
+        self.index.refresh_files()
+        self.assertEqual(
+            [f['id'] for f in self.index.find_files(name='a.zip')],
+            ['f4', 'f3', 'f1'])
+
+        del self.connect.files[0]
+        self.index.refresh_files(full=True)
+        self.assertEqual([f['id'] for f in self.index.find_files(regex='^a')],
+                         ['f3', 'f1'])
+
+    def test_find_files_does_not_read_api_config(self):
+        self.add_files('a.zip', 'b.zip')
+        self.index.refresh_files()
+        self.config.side_effect = ValueError
+
+        self.assertEqual([f['name'] for f in self.index.find_files()],
+                         ['b.zip', 'a.zip'])
+
+    def test_newest_file_skips_files_deleted_since_refresh(self):
+        self.add_files('a.zip', 'a.zip')
+        self.index.refresh_files()
+        self.connect.deleted_files = {'f2'}
+
+        self.assertEqual(self.index.get_newest_file_by_name('a.zip').id, 'f1')
+        self.assertEqual([f['id'] for f in self.index.find_files()], ['f1'])
+
+    def test_newest_file_sees_files_uploaded_since_refresh(self):
+        self.add_files('a.zip')
+        self.index.refresh_files()
+        self.add_files('a.zip')
+        del self.connect.fetched[:]
+
+        self.assertEqual(self.index.get_newest_file_by_name('a.zip').id, 'f2')
+        self.assertEqual(self.connect.fetched,
+                         [('files/', 'f2'), ('files/', 'f1')])
+
+    def test_client_falls_back_to_search_without_index_match(self):
+        self.index.refresh_files()
+        found = RescaleFile(json_data={'id': 'f9', 'name': 'a.zip'})
+        with mock.patch.object(RescaleFile, 'search',
+                               return_value=iter([found])):
+            self.assertIs(RescaleFile.get_newest_by_name('a.zip', self.index),
+                          found)
+
+    def test_other_account_starts_empty_index(self):
+        path = os.path.join(tempfile.mkdtemp(), 'index.db')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        first = RescaleIndex(path, connect=self.connect)
+        self.add_jobs('a')
+        first.refresh_jobs()
+        first.close()
+
+        other = RescaleIndex(path, connect=FakeConnect(api_key='other'))
+        self.addCleanup(other.close)
+        self.assertEqual(other.refresh_jobs(), 0)
+        self.assertEqual(list(other.find_jobs()), [])
+        self.assertIsNone(other.last_synced('files'))
+
+    def test_opening_index_does_not_read_api_config(self):
+        with mock.patch('rescale.index.RescaleConnect',
+                        side_effect=AssertionError):
+            index = RescaleIndex(':memory:')
+            self.addCleanup(index.close)
+            self.assertEqual(list(index.find_jobs()), [])
+
+
+if __name__ == '__main__':
+    unittest.main()